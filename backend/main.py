@@ -1,34 +1,80 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from typing import List, Optional
 from pathlib import Path
 from uuid import uuid4
 import aiofiles
+import aiofiles.os
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import orjson
+import os
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from datetime import datetime, timedelta
 from starlette.concurrency import run_in_threadpool
 
 from sqlalchemy import (
-    create_engine,
+    event,
     Column,
     Integer,
     String,
     DateTime,
     ForeignKey,
+    Index,
     UniqueConstraint,
+    and_,
+    false,
     func,
     select,
+    bindparam,
     desc,
     delete,
+    update,
+    inspect,
+    text,
+    tuple_,
 )
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
 
 # --- DB setup (SQLite) ---
-DATABASE_URL = "sqlite:///./app.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+DATABASE_URL = "sqlite+aiosqlite:///./app.db"
+engine = create_async_engine(DATABASE_URL, pool_size=10, max_overflow=20)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets /images readers run while a like/upload is writing
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "mmap_size=268435456",
+        "cache_size=-64000",
+        "busy_timeout=5000",
+        "foreign_keys=ON",  # needed for ondelete="CASCADE" to fire
+    ):
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+# expire_on_commit=False: handlers read rows after commit, and an expired
+# attribute cannot be lazy-loaded on an async session
+AsyncSessionLocal = async_sessionmaker(
+    engine, autoflush=False, autocommit=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -43,6 +89,13 @@ class Image(Base):
     content_type = Column(String, nullable=True)
     size = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # denormalized count of likes, kept in sync by like_image
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# one index per seek-paginated sort, matching its ORDER BY
+Index("ix_images_created_id", Image.created_at.desc(), Image.id.desc())
+Index("ix_images_likes_count", Image.likes_count.desc(), Image.id.desc())
 
 
 class Like(Base):
@@ -52,28 +105,239 @@ class Like(Base):
     image_id = Column(
         Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False
     )
-    user_hash = Column(String, nullable=False, index=True)
+    user_hash = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # uix_image_user also serves (image_id, user_hash) lookups
     __table_args__ = (UniqueConstraint("image_id", "user_hash", name="uix_image_user"),)
 
 
-Base.metadata.create_all(bind=engine)
+# lets trending read only the last week of likes
+Index("ix_likes_created_image", Like.created_at, Like.image_id)
+# "which of these images did this user like" without touching the table
+Index("ix_likes_user_image", Like.user_hash, Like.image_id)
+
+
+def _migrate(conn):
+    # create_all only creates missing tables; bring older databases up to date
+    insp = inspect(conn)
+    if "likes_count" not in {c["name"] for c in insp.get_columns("images")}:
+        _add_likes_count(conn)
+    created = False
+    # superseded by ix_likes_user_image
+    if "ix_likes_user_hash" in {ix["name"] for ix in insp.get_indexes("likes")}:
+        conn.execute(text("DROP INDEX ix_likes_user_hash"))
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+                created = True
+    if created:
+        # refresh planner statistics so the new indexes get picked
+        conn.execute(text("ANALYZE"))
+
+
+def _add_likes_count(conn):
+    # databases created before likes_count existed: add the column and backfill it
+    conn.execute(
+        text("ALTER TABLE images ADD COLUMN likes_count INTEGER NOT NULL DEFAULT 0")
+    )
+    conn.execute(
+        text(
+            "UPDATE images SET likes_count = "
+            "(SELECT COUNT(*) FROM likes WHERE likes.image_id = images.id)"
+        )
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate)
+    yield
+    await engine.dispose()
+
+
+# --- Prepared statements ---
+# built once at import; handlers only bind parameters, so SQLAlchemy does not
+# rebuild the statement or recompute its cache key on every request
+def _with_liked_flag(stmt):
+    # the (image_id, user_hash) unique index makes this one lookup per row
+    return stmt.add_columns(Like.id.is_not(None).label("liked_by_user")).outerjoin(
+        Like,
+        and_(Like.image_id == Image.id, Like.user_hash == bindparam("user_hash")),
+    )
+
+
+def _without_liked_flag(stmt):
+    return stmt.add_columns(false().label("liked_by_user"))
+
+
+# the listing selects plain columns: rows come back as tuples, skipping Image
+# instance construction and identity-map bookkeeping
+_LIST_COLUMNS = (
+    Image.id,
+    Image.author_name,
+    Image.image_name,
+    Image.original_filename,
+    Image.stored_filename,
+    Image.content_type,
+    Image.size,
+    Image.created_at,
+    Image.likes_count,
+)
+_LIST_FIELDS = tuple(c.key for c in _LIST_COLUMNS)
+
+
+def _build_list_stmts() -> dict:
+    # keyed by (sort, seek?); seek sorts page on (key, id) < (:after_key, :after_id)
+    base = {}
+    for sort, key in (("recent", Image.created_at), ("popular", Image.likes_count)):
+        stmt = select(*_LIST_COLUMNS).order_by(key.desc(), Image.id.desc())
+        base[sort, False] = stmt.offset(bindparam("skip"))
+        base[sort, True] = stmt.where(
+            tuple_(key, Image.id)
+            < tuple_(
+                bindparam("after_key", type_=key.type),
+                bindparam("after_id", type_=Integer),
+            )
+        )
+    # trending: count likes since :cutoff once, then join the counts to images.
+    # left alone, SQLite walks the whole (image_id, user_hash) index to skip the
+    # GROUP BY sort; a + 0 on the grouping term rules that index out, so
+    # the week is read as a range of ix_likes_created_image instead (the
+    # sqlite dialect does not render with_hint/INDEXED BY)
+    weekly = (
+        select(Like.image_id, func.count(Like.id).label("c"))
+        .where(Like.created_at >= bindparam("cutoff", type_=DateTime))
+        .group_by(Like.image_id + 0)
+        .cte("weekly")
+    )
+    base["trending", False] = (
+        select(*_LIST_COLUMNS, func.coalesce(weekly.c.c, 0).label("likes_week"))
+        .outerjoin(weekly, weekly.c.image_id == Image.id)
+        .order_by(desc("likes_week"), Image.id.desc())
+        .offset(bindparam("skip"))
+    )
+    # final key: (sort, seek?, with liked_by_user for :user_hash?)
+    stmts = {}
+    for k, stmt in base.items():
+        stmt = stmt.limit(bindparam("lim"))
+        stmts[(*k, True)] = _with_liked_flag(stmt)
+        stmts[(*k, False)] = _without_liked_flag(stmt)
+    return stmts
+
+
+_LIST_STMTS = _build_list_stmts()
+
+# DML targets the Core tables: with a parameter dict, ORM-enabled statements
+# would switch to bulk mode and lose rowcount
+likes_table = Like.__table__
+images_table = Image.__table__
+# uploads are content-addressed: identical bytes get the same stored_filename,
+# and the row of the first upload is returned for later ones
+_STMT_INSERT_IMAGE = (
+    sqlite_insert(images_table)
+    .values(
+        author_name=bindparam("author_name"),
+        image_name=bindparam("image_name"),
+        original_filename=bindparam("original_filename"),
+        stored_filename=bindparam("stored_filename"),
+        content_type=bindparam("content_type"),
+        size=bindparam("size"),
+        created_at=bindparam("created_at"),
+    )
+    .on_conflict_do_nothing(index_elements=["stored_filename"])
+    .returning(*images_table.c)
+)
+_STMT_IMAGE_BY_FILENAME = select(*images_table.c).where(
+    images_table.c.stored_filename == bindparam("stored_filename")
+)
+# existence check for like/unlike; reads one column instead of hydrating an Image
+_STMT_IMAGE_LIKES = select(images_table.c.likes_count).where(
+    images_table.c.id == bindparam("image_id")
+)
+_STMT_LIKE = (
+    sqlite_insert(likes_table)
+    .values(
+        image_id=bindparam("image_id"),
+        user_hash=bindparam("user_hash"),
+        created_at=bindparam("created_at"),
+    )
+    .on_conflict_do_nothing(index_elements=["image_id", "user_hash"])
+)
+_STMT_UNLIKE = (
+    delete(likes_table)
+    .where(
+        likes_table.c.image_id == bindparam("image_id"),
+        likes_table.c.user_hash == bindparam("user_hash"),
+    )
+    .returning(likes_table.c.id)
+)
+_STMT_ADD_LIKES = (
+    update(images_table)
+    .where(images_table.c.id == bindparam("image_id"))
+    .values(likes_count=images_table.c.likes_count + bindparam("delta", type_=Integer))
+    .returning(images_table.c.likes_count)
+)
+_STMT_LIKED_IDS = select(Like.image_id).where(Like.user_hash == bindparam("user_hash"))
+_STMT_LIKED_ONE = select(Like.id).where(
+    Like.image_id == bindparam("image_id"), Like.user_hash == bindparam("user_hash")
+)
+
+# --- Cache setup (Redis, optional) ---
+# caching of GET /images is disabled when REDIS_URL is not set
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+
+# seconds a cached listing page stays fresh, per sort
+LIST_CACHE_TTL = {"recent": 15, "popular": 45, "trending": 45}
+# stale copies are served only when the DB fails; keep them for a day. Only
+# anonymous pages get one, so their number does not grow with users, and redis
+# evicts the least recently used of them at maxmemory (docker-compose.dev.yml)
+LIST_STALE_TTL = 24 * 60 * 60
+# liked:<sha1(user_hash)> sets expire after an hour without reads or updates and are
+# then rebuilt from SQL
+LIKED_SET_TTL = 60 * 60
+# member marking a liked set as complete (image ids start at 1)
+LIKED_SET_SENTINEL = 0
 
 # --- App setup ---
-app = FastAPI(title="Simple Image Upload + Gallery API")
+app = FastAPI(title="Simple Image Upload + Gallery API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # tighten in production
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "Warning"],
 )
 
 IMAGES_DIR = Path("data/images")
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-
-# serve uploaded images at /images/<stored_filename>
-app.mount("/images", StaticFiles(directory=str(IMAGES_DIR)), name="images")
+# extensions accepted for uploads; anything else is rejected before touching disk
+_ALLOWED_EXT = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
+# uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+# how long a group fsync waits for concurrent uploads to join it
+FSYNC_BATCH_DELAY = 0.005
+
+# stored filenames are the SHA-256 of the content, so a name always maps to the
+# same bytes and clients may cache forever
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# when set, /images/<name> hands the file off to the reverse proxy instead of
+# streaming it through Python, e.g. with nginx:
+#   location /internal-images/ { internal; alias /app/data/images/; sendfile on; tcp_nopush on; }
+IMAGES_ACCEL_REDIRECT = os.getenv("IMAGES_ACCEL_REDIRECT")  # e.g. "/internal-images"
+# prefix of image_url in responses; relative by default, set it to a CDN or
+# absolute origin if clients should not resolve it against the API
+IMAGES_URL_PREFIX = os.getenv("PUBLIC_IMAGES_URL", "/images").rstrip("/")
+
+
+# deepest OFFSET GET /images will run; beyond it clients must use cursors.
+# trending cursors are offsets too, so trending ends at this depth
+MAX_LIST_OFFSET = 10_000
 
 
 # --- Pydantic schemas ---
@@ -89,6 +353,8 @@ class ImageOut(BaseModel):
     likes_count: int
     liked_by_user: bool
     image_url: str
+    # opaque cursor to pass as ?after= to get the items following this one
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -99,47 +365,276 @@ class LikeAction(BaseModel):
     action: str  # "like" or "unlike"
 
 
-# --- Helpers (DB work runs inside threadpool) ---
-def _create_image_record(
+# --- Helpers ---
+async def _create_image_record(
     author_name, image_name, original_filename, stored_filename, content_type, size
 ):
-    db = SessionLocal()
+    # the new row comes back from INSERT ... RETURNING; only a duplicate
+    # upload (the INSERT did nothing) needs a SELECT for the existing one
+    db = AsyncSessionLocal()
     try:
-        img = Image(
-            author_name=author_name,
-            image_name=image_name,
-            original_filename=original_filename,
-            stored_filename=stored_filename,
-            content_type=content_type,
-            size=size,
-            created_at=datetime.utcnow(),
-        )
-        db.add(img)
-        db.commit()
-        db.refresh(img)
+        params = {
+            "author_name": author_name,
+            "image_name": image_name,
+            "original_filename": original_filename,
+            "stored_filename": stored_filename,
+            "content_type": content_type,
+            "size": size,
+            "created_at": datetime.utcnow(),
+        }
+        img = (await db.execute(_STMT_INSERT_IMAGE, params)).first()
+        if img is None:
+            img = (await db.execute(_STMT_IMAGE_BY_FILENAME, params)).one()
+        await db.commit()
         return img
     finally:
-        db.close()
+        await db.close()
+
+
+# --- Durable writes (group fsync) ---
+# uploads queue their fd here and wait; one drain task fsyncs the whole batch
+# (plus the images dir, once) so a burst of uploads shares one disk flush
+_pending_fsyncs: List[tuple] = []
+_fsync_task: Optional[asyncio.Task] = None
+
+
+def _fsync_batch(fds: List[int]) -> List[Optional[OSError]]:
+    errors = []
+    for fd in fds:
+        try:
+            os.fsync(fd)
+            errors.append(None)
+        except OSError as e:
+            errors.append(e)
+        finally:
+            os.close(fd)
+    # make the new directory entries durable too
+    dir_fd = os.open(IMAGES_DIR, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return errors
+
+
+async def _drain_fsyncs():
+    while _pending_fsyncs:
+        await asyncio.sleep(FSYNC_BATCH_DELAY)
+        batch = _pending_fsyncs[:]
+        _pending_fsyncs.clear()
+        try:
+            errors = await run_in_threadpool(_fsync_batch, [fd for fd, _ in batch])
+        except OSError as e:
+            errors = [e] * len(batch)
+        for (_, waiter), err in zip(batch, errors):
+            if waiter.done():
+                continue
+            if err:
+                waiter.set_exception(err)
+            else:
+                waiter.set_result(None)
+
+
+async def _fsync(fd: int):
+    global _fsync_task
+    waiter = asyncio.get_running_loop().create_future()
+    # the batch owns a dup so the caller may close its file at any time
+    _pending_fsyncs.append((os.dup(fd), waiter))
+    if _fsync_task is None or _fsync_task.done():
+        _fsync_task = asyncio.create_task(_drain_fsyncs())
+    await waiter
+
+
+# --- Cursor pagination ---
+# cursors are base64(json) of {"s": sort, ...}; `recent` and `popular` carry the
+# seek key ((created_at, id) / (likes_count, id)), `trending` carries the offset
+def _encode_cursor(sort: str, **fields) -> str:
+    raw = orjson.dumps({"s": sort, **fields})
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _cursor_int(value) -> int:
+    # SQLite integers are signed 64-bit; wider values would fail at execute time
+    n = int(value)
+    if not -(2**63) <= n < 2**63:
+        raise ValueError("cursor field out of range")
+    return n
 
 
-def _get_total_likes_for_ids(db, ids: List[int]) -> dict:
-    if not ids:
-        return {}
-    rows = db.execute(
-        select(Like.image_id, func.count(Like.id))
-        .where(Like.image_id.in_(ids))
-        .group_by(Like.image_id)
-    ).all()
-    return {r[0]: r[1] for r in rows}
+def _decode_cursor(cursor: str, sort: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(data, dict) or data.get("s") != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    return data
+
+
+# --- List cache ---
+# keys look like images:<sort>:<sha1(user_hash)>:<sha1(params)>; each sort keeps
+# its live keys in images:<sort>:keys (and recent also per user, in
+# images:recent:<sha1(user_hash)>:keys) so invalidation deletes just those
+def _cache_user(user_hash: Optional[str]) -> str:
+    return hashlib.sha1((user_hash or "").encode()).hexdigest()
+
+
+def _list_cache_key(sort: str, user_hash: Optional[str], *params) -> str:
+    query = hashlib.sha1(repr(params).encode()).hexdigest()
+    return f"images:{sort}:{_cache_user(user_hash)}:{query}"
+
+
+def _cache_index(sort: str, user_hash: Optional[str] = None) -> str:
+    if user_hash is None:
+        return f"images:{sort}:keys"
+    return f"images:{sort}:{_cache_user(user_hash)}:keys"
 
 
-def _get_liked_ids_by_user(db, ids: List[int], user_hash: str) -> set:
-    if not ids or not user_hash:
-        return set()
-    rows = db.execute(
-        select(Like.image_id).where(Like.image_id.in_(ids), Like.user_hash == user_hash)
-    ).all()
-    return {r[0] for r in rows}
+async def _cache_get(key: str) -> Optional[bytes]:
+    if redis_client is None:
+        return None
+    try:
+        return await redis_client.get(key)
+    except RedisError:
+        return None
+
+
+async def _cache_set(key: str, sort: str, user_hash: Optional[str], body: bytes):
+    if redis_client is None:
+        return
+    ttl = LIST_CACHE_TTL[sort]
+    indexes = [_cache_index(sort)]
+    if sort == "recent":
+        # a like only drops the liker's own recent pages
+        indexes.append(_cache_index(sort, user_hash))
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, body, ex=ttl)
+            if not user_hash:
+                pipe.set(f"stale:{key}", body, ex=LIST_STALE_TTL)
+            for index in indexes:
+                # an index outlives every key it lists, so nothing is missed
+                pipe.sadd(index, key)
+                pipe.expire(index, ttl)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def _cache_invalidate(*indexes: str):
+    if redis_client is None:
+        return
+    try:
+        # read and drop each index atomically: a key cached meanwhile lands in
+        # a fresh index instead of being lost between the two steps
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for index in indexes:
+                pipe.smembers(index)
+                pipe.delete(index)
+            replies = await pipe.execute()
+        keys = set().union(*replies[::2])
+        if keys:
+            await redis_client.delete(*keys)
+    except RedisError:
+        pass
+
+
+# --- Liked-by-user sets ---
+# liked:<sha1(user_hash)> holds every image id the user likes plus
+# LIKED_SET_SENTINEL; a set without the sentinel was created by SADD after
+# expiry and is incomplete. liked:<sha1(user_hash)>:v is bumped by every write
+# to the set, so rebuilds and updates can WATCH it: WATCH ignores no-op writes
+# (SREM of an absent id), and the counter orders updates against each other
+def _liked_key(user_hash: str) -> str:
+    return f"liked:{_cache_user(user_hash)}"
+
+
+def _liked_version_key(user_hash: str) -> str:
+    return f"{_liked_key(user_hash)}:v"
+
+
+async def _load_liked_ids(db, user_hash: str) -> set:
+    return set((await db.execute(_STMT_LIKED_IDS, {"user_hash": user_hash})).scalars())
+
+
+async def _get_liked_ids_by_user(db, user_hash: str) -> Optional[set]:
+    """Image ids liked by user_hash, or None when Redis is unavailable."""
+    if redis_client is None:
+        return None
+    key = _liked_key(user_hash)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.smembers(key)
+            pipe.expire(key, LIKED_SET_TTL)
+            members, _ = await pipe.execute()
+    except RedisError:
+        return None
+    ids = {int(m) for m in members}
+    if LIKED_SET_SENTINEL in ids:
+        ids.discard(LIKED_SET_SENTINEL)
+        return ids
+
+    # missing or incomplete: rebuild from the (user_hash, image_id) index. The keys are
+    # watched before the SQL read, so a like/unlike landing meanwhile makes
+    # EXEC fail instead of being overwritten by older ids
+    ids = None
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            await pipe.watch(key, _liked_version_key(user_hash))
+            ids = await _load_liked_ids(db, user_hash)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(key, LIKED_SET_SENTINEL, *ids)
+            pipe.expire(key, LIKED_SET_TTL)
+            await pipe.execute()
+    except RedisError:
+        # WatchError included: the set stays incomplete and the next listing
+        # rebuilds it
+        pass
+    if ids is None:
+        ids = await _load_liked_ids(db, user_hash)
+    return ids
+
+
+async def _update_liked_set(user_hash: str, image_id: int):
+    # runs after the like/unlike commit. The row is re-read under WATCH of the
+    # version key, so of two racing updates the one applied last saw the
+    # other's commit, and the set ends up matching SQL whatever order they
+    # reach Redis in
+    if redis_client is None:
+        return
+    key = _liked_key(user_hash)
+    version_key = _liked_version_key(user_hash)
+    params = {"image_id": image_id, "user_hash": user_hash}
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            await pipe.watch(version_key)
+            db = AsyncSessionLocal()
+            try:
+                liked = (await db.execute(_STMT_LIKED_ONE, params)).first()
+            finally:
+                await db.close()
+            pipe.multi()
+            if liked:
+                pipe.sadd(key, image_id)
+            else:
+                pipe.srem(key, image_id)
+            pipe.incr(version_key)
+            pipe.expire(key, LIKED_SET_TTL)
+            pipe.expire(version_key, LIKED_SET_TTL)
+            await pipe.execute()
+    except (RedisError, SQLAlchemyError):
+        # WatchError included: another update got in between and this one may
+        # be older than it; drop the set and let the next listing rebuild it
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.incr(version_key)
+                pipe.expire(version_key, LIKED_SET_TTL)
+                await pipe.execute()
+        except RedisError:
+            pass
 
 
 # --- Endpoints ---
@@ -147,7 +642,6 @@ def _get_liked_ids_by_user(db, ids: List[int], user_hash: str) -> set:
 
 @app.post("/image", response_model=ImageOut)
 async def upload_image(
-    request: Request,
     authorName: Optional[str] = Form(None),
     imageName: Optional[str] = Form(None),
     image: UploadFile = File(...),
@@ -162,19 +656,40 @@ async def upload_image(
     if not image:
         raise HTTPException(status_code=400, detail="No image file provided")
 
-    contents = await image.read()
-    size = len(contents)
-
     original = Path(image.filename or "upload")
-    ext = original.suffix or ".png"
-    stored_filename = f"{uuid4().hex}{ext}"
-    stored_path = IMAGES_DIR / stored_filename
-
-    async with aiofiles.open(stored_path, "wb") as f:
-        await f.write(contents)
+    ext = original.suffix.lower() or ".png"
+    if ext not in _ALLOWED_EXT:
+        raise HTTPException(status_code=415, detail="Unsupported image type")
+
+    # stream to a temp file (dot names are never served), hashing as we go;
+    # the file is then stored under its SHA-256 so duplicates share one copy
+    tmp_path = IMAGES_DIR / f".{uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await image.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                digest.update(chunk)
+                await f.write(chunk)
+            await f.flush()
+
+            # 52-char base32 of the digest instead of 64-char hex
+            name = base64.b32encode(digest.digest()).rstrip(b"=").decode("ascii")
+            stored_filename = f"{name.lower()}{ext}"
+            stored_path = IMAGES_DIR / stored_filename
+            if await aiofiles.os.path.exists(stored_path):
+                await aiofiles.os.remove(tmp_path)
+            else:
+                # rename before the fsync so the batch's directory fsync covers
+                # the final name
+                await aiofiles.os.replace(tmp_path, stored_path)
+                await _fsync(f.fileno())
+    finally:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
 
-    img = await run_in_threadpool(
-        _create_image_record,
+    img = await _create_image_record(
         authorName,
         imageName,
         str(original.name),
@@ -182,12 +697,9 @@ async def upload_image(
         image.content_type,
         size,
     )
+    await _cache_invalidate(_cache_index("recent"))
 
-    # build image_url (absolute)
-    base = str(request.base_url)  # includes trailing slash
-    image_url = base.rstrip("/") + f"/images/{stored_filename}"
-
-    # likes initially zero
+    # a duplicate upload returns the existing image, likes included
     return ImageOut(
         id=img.id,
         author_name=img.author_name,
@@ -197,15 +709,15 @@ async def upload_image(
         content_type=img.content_type,
         size=img.size,
         created_at=img.created_at,
-        likes_count=0,
+        likes_count=img.likes_count,
         liked_by_user=False,
-        image_url=image_url,
+        image_url=f"{IMAGES_URL_PREFIX}/{stored_filename}",
     )
 
 
 @app.get("/images", response_model=List[ImageOut])
 async def list_images(
-    request: Request,
+    after: Optional[str] = None,
     page: int = 1,
     limit: int = 20,
     sort: str = "recent",  # 'trending' | 'popular' | 'recent'
@@ -214,108 +726,148 @@ async def list_images(
     """
     Paginated list for infinite scroll.
     Query params:
-      - page (1-based)
+      - after (optional): `next_cursor` of the last item already loaded
+      - page (1-based, deprecated): used only when `after` is not given
       - limit
       - sort: trending | popular | recent
       - user_hash (optional): to mark liked_by_user flags
     Returns up to `limit` items (does not return has_more; client can request next page).
     """
+    if sort not in ("trending", "popular", "recent"):
+        sort = "recent"  # fallback to recent
     page = max(1, page)
     limit = max(1, min(100, limit))
     skip = (page - 1) * limit
 
-    def _db_work():
-        db = SessionLocal()
+    seek = None
+    if after:
+        cursor = _decode_cursor(after, sort)
         try:
-            images = []
-            # recent: order by created_at desc
             if sort == "recent":
-                rows = (
-                    db.execute(
-                        select(Image)
-                        .order_by(Image.created_at.desc())
-                        .offset(skip)
-                        .limit(limit)
-                    )
-                    .scalars()
-                    .all()
+                seek = (
+                    datetime.fromisoformat(cursor["ts"]),
+                    _cursor_int(cursor["id"]),
                 )
-                images = rows
             elif sort == "popular":
-                stmt = (
-                    select(Image, func.count(Like.id).label("likes"))
-                    .outerjoin(Like, Like.image_id == Image.id)
-                    .group_by(Image.id)
-                    .order_by(desc("likes"))
-                    .offset(skip)
-                    .limit(limit)
-                )
-                rows = db.execute(stmt).all()
-                images = [r[0] for r in rows]
-            elif sort == "trending":
-                cutoff = datetime.utcnow() - timedelta(days=7)
-                # use a correlated subquery to count likes in the last 7 days per image
-                likes_week_subq = (
-                    select(func.count(Like.id))
-                    .where(Like.image_id == Image.id, Like.created_at >= cutoff)
-                    .scalar_subquery()
-                )
-                stmt = (
-                    select(Image, likes_week_subq.label("likes_week"))
-                    .order_by(desc("likes_week"))
-                    .offset(skip)
-                    .limit(limit)
-                )
-                rows = db.execute(stmt).all()
-                images = [r[0] for r in rows]
+                seek = (_cursor_int(cursor["lc"]), _cursor_int(cursor["id"]))
             else:
-                # fallback to recent
-                rows = (
-                    db.execute(
-                        select(Image)
-                        .order_by(Image.created_at.desc())
-                        .offset(skip)
-                        .limit(limit)
-                    )
-                    .scalars()
-                    .all()
-                )
-                images = rows
-
-            ids = [img.id for img in images]
-            # total likes per image
-            total_likes_map = _get_total_likes_for_ids(db, ids)
-            # which of these ids the user has liked
-            liked_ids = (
-                _get_liked_ids_by_user(db, ids, user_hash) if user_hash else set()
+                skip = max(0, _cursor_int(cursor["o"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if seek is None and skip > MAX_LIST_OFFSET:
+        # usually a crawler walking page=; log it so the traffic is visible
+        logger.warning(
+            "rejected deep listing: sort=%s skip=%d limit=%d", sort, skip, limit
+        )
+        if sort == "trending":
+            detail = f"Trending results stop at {MAX_LIST_OFFSET} items"
+        else:
+            detail = (
+                f"Cannot page deeper than {MAX_LIST_OFFSET} items; "
+                "use next_cursor as ?after= instead of ?page="
             )
+        raise HTTPException(status_code=400, detail=detail)
+
+    cache_key = _list_cache_key(sort, user_hash, after, page, limit)
+    cached = await _cache_get(cache_key)
+    if cached is not None:
+        return Response(
+            cached, media_type="application/json", headers={"X-Cache": "HIT"}
+        )
 
-            # build response payload list
+    async def _db_work():
+        db = AsyncSessionLocal()
+        try:
+            params = {"lim": limit}
+            if seek:
+                params["after_key"], params["after_id"] = seek
+            else:
+                params["skip"] = skip
+            if sort == "trending":
+                params["cutoff"] = datetime.utcnow() - timedelta(days=7)
+            # liked flags come from the user's Redis set when there is one,
+            # otherwise from a join in the listing query
+            liked_ids = None
+            if user_hash:
+                liked_ids = await _get_liked_ids_by_user(db, user_hash)
+            join_liked = bool(user_hash) and liked_ids is None
+            if join_liked:
+                params["user_hash"] = user_hash
+            stmt = _LIST_STMTS[sort, seek is not None, join_liked]
+            rows = (await db.execute(stmt, params)).all()
+
+            # build the payload as plain dicts: rows come straight from the DB, so
+            # re-validating them through ImageOut would be wasted work
             result = []
-            base = str(request.base_url).rstrip("/")
-            for img in images:
-                image_url = base + f"/images/{img.stored_filename}"
-                result.append(
-                    ImageOut(
-                        id=img.id,
-                        author_name=img.author_name,
-                        image_name=img.image_name,
-                        original_filename=img.original_filename,
-                        stored_filename=img.stored_filename,
-                        content_type=img.content_type,
-                        size=img.size,
-                        created_at=img.created_at,
-                        likes_count=int(total_likes_map.get(img.id, 0)),
-                        liked_by_user=img.id in liked_ids,
-                        image_url=image_url,
+            for i, row in enumerate(rows):
+                # the leading columns are _LIST_COLUMNS, in order
+                item = dict(zip(_LIST_FIELDS, row))
+                if liked_ids is None:
+                    item["liked_by_user"] = bool(row.liked_by_user)
+                else:
+                    item["liked_by_user"] = item["id"] in liked_ids
+                item["image_url"] = f"{IMAGES_URL_PREFIX}/{item['stored_filename']}"
+                if sort == "recent":
+                    item["next_cursor"] = _encode_cursor(
+                        sort, ts=item["created_at"].isoformat(), id=item["id"]
                     )
-                )
+                elif sort == "popular":
+                    item["next_cursor"] = _encode_cursor(
+                        sort, lc=item["likes_count"], id=item["id"]
+                    )
+                else:
+                    # no cursor past the cap: following it would only get a 400
+                    o = skip + i + 1
+                    item["next_cursor"] = (
+                        _encode_cursor(sort, o=o) if o <= MAX_LIST_OFFSET else None
+                    )
+                result.append(item)
             return result
         finally:
-            db.close()
+            await db.close()
 
-    res = await run_in_threadpool(_db_work)
-    return res
+    try:
+        res = await _db_work()
+    except SQLAlchemyError:
+        # DB is unavailable: fall back to the last good copy of this page
+        stale = await _cache_get(f"stale:{cache_key}")
+        if stale is None:
+            raise
+        return Response(
+            stale,
+            media_type="application/json",
+            headers={"X-Cache": "STALE", "Warning": '110 - "Response is Stale"'},
+        )
+
+    body = orjson.dumps(res)
+    await _cache_set(cache_key, sort, user_hash, body)
+    return Response(body, media_type="application/json", headers={"X-Cache": "MISS"})
+
+
+@app.api_route("/images/{stored_filename}", methods=["GET", "HEAD"])
+async def get_image_file(stored_filename: str, request: Request):
+    """
+    Serve an uploaded image at /images/<stored_filename>.
+    Behind a proxy (IMAGES_ACCEL_REDIRECT set) only headers are returned and the
+    proxy sends the file itself.
+    """
+    if stored_filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": f'"{stored_filename}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if IMAGES_ACCEL_REDIRECT:
+        headers["X-Accel-Redirect"] = (
+            f"{IMAGES_ACCEL_REDIRECT.rstrip('/')}/{stored_filename}"
+        )
+        return Response(headers=headers)
+
+    path = IMAGES_DIR / stored_filename
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, headers=headers)
 
 
 @app.post("/api/images/{image_id}/like")
@@ -328,49 +880,59 @@ async def like_image(image_id: int, action: LikeAction):
     if not action.user_hash or action.action not in ("like", "unlike"):
         raise HTTPException(status_code=400, detail="Invalid payload")
 
-    def _db():
-        db = SessionLocal()
+    async def _db():
+        db = AsyncSessionLocal()
         try:
-            img = db.get(Image, image_id)
-            if not img:
-                raise HTTPException(status_code=404, detail="Image not found")
+            current = (
+                await db.execute(_STMT_IMAGE_LIKES, {"image_id": image_id})
+            ).scalar()
+            if current is None:
+                return "not_found", None
 
+            params = {"image_id": image_id, "user_hash": action.user_hash}
             if action.action == "like":
-                like = Like(
-                    image_id=image_id,
-                    user_hash=action.user_hash,
-                    created_at=datetime.utcnow(),
+                # a repeated like is a no-op insert rather than an IntegrityError
+                result = await db.execute(
+                    _STMT_LIKE, {**params, "created_at": datetime.utcnow()}
                 )
-                db.add(like)
-                try:
-                    db.commit()
-                except IntegrityError:
-                    db.rollback()  # already liked
-                # compute total likes
-                total = db.execute(
-                    select(func.count(Like.id)).where(Like.image_id == image_id)
-                ).scalar_one()
+                delta = 1 if result.rowcount == 1 else 0
                 liked_by_user = True
             else:  # unlike
-                stmt = delete(Like).where(
-                    Like.image_id == image_id, Like.user_hash == action.user_hash
-                )
-                db.execute(stmt)
-                db.commit()
-                total = db.execute(
-                    select(func.count(Like.id)).where(Like.image_id == image_id)
-                ).scalar_one()
+                result = await db.execute(_STMT_UNLIKE, params)
+                delta = -1 if result.first() is not None else 0
                 liked_by_user = False
 
-            return {
+            if delta:
+                result = await db.execute(
+                    _STMT_ADD_LIKES, {"image_id": image_id, "delta": delta}
+                )
+                total = result.scalar_one()
+            else:
+                # nothing changed: the count read by the existence check is current
+                total = current
+            await db.commit()
+
+            return "changed" if delta else "unchanged", {
                 "image_id": image_id,
                 "likes_count": int(total),
                 "liked_by_user": liked_by_user,
             }
         finally:
-            db.close()
-
-    return await run_in_threadpool(_db)
+            await db.close()
+
+    status, res = await _db()
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Image not found")
+    if status == "unchanged":
+        # a repeated like or unlike: cached pages and the liked set still hold
+        return res
+    await _update_liked_set(action.user_hash, image_id)
+    await _cache_invalidate(
+        _cache_index("popular"),
+        _cache_index("trending"),
+        _cache_index("recent", action.user_hash),
+    )
+    return res
 
 
 @app.get("/")
@@ -20,10 +20,16 @@ type ImageOut = {
   likes_count: number;
   liked_by_user: boolean;
   image_url: string;
+  next_cursor?: string | null;
 };
 
 const API_URL = (import.meta.env.VITE_API_URL as string) ?? "";
 
+// image_url may be relative to the API (e.g. "/images/<name>")
+function imageSrc(url: string): string {
+  return new URL(url, new URL(API_URL, location.origin)).toString();
+}
+
 // key used in localStorage for the persisted user hash
 const USER_HASH_KEY = "pixel_app_user_hash";
 
@@ -68,6 +74,9 @@ export function Gallery(): ReactElement {
   // sentinel ref for intersection observer
   const sentinelRef = useRef<HTMLDivElement | null>(null);
 
+  // cursor of the last loaded item, sent as `after` to fetch the next page
+  const cursorRef = useRef<string | null>(null);
+
   // keep a set of loaded ids to avoid duplicates if backend returns overlapping pages
   const loadedIdsRef = useRef<Set<number>>(new Set());
 
@@ -92,10 +101,11 @@ export function Gallery(): ReactElement {
 
   // fetch a page of images
   const fetchPage = useCallback(
-    async (pageToLoad: number) => {
+    async (pageToLoad: number, after?: string | null) => {
       if (!hasMoreRef.current && pageToLoad !== 1) return [];
       const url = new URL(`${API_URL}/images`, location.origin);
-      url.searchParams.set("page", String(pageToLoad));
+      if (after) url.searchParams.set("after", after);
+      else url.searchParams.set("page", String(pageToLoad));
       url.searchParams.set("limit", String(limit));
       url.searchParams.set("sort", sort);
       if (userHashRef.current)
@@ -120,6 +130,7 @@ export function Gallery(): ReactElement {
       setLoading(true);
       setHasMore(true);
       loadedIdsRef.current.clear();
+      cursorRef.current = null;
       setPage(1);
       try {
         const data = await fetchPage(1);
@@ -127,7 +138,8 @@ export function Gallery(): ReactElement {
         const unique = data.filter((d) => !loadedIdsRef.current.has(d.id));
         unique.forEach((d) => loadedIdsRef.current.add(d.id));
         setImages(unique);
-        setHasMore(data.length >= limit);
+        cursorRef.current = data.at(-1)?.next_cursor ?? null;
+        setHasMore(data.length >= limit && data.at(-1)?.next_cursor !== null);
         setPage(1);
       } catch (err: any) {
         setError(err?.message ?? "Unknown error");
@@ -150,12 +162,14 @@ export function Gallery(): ReactElement {
     setLoadingMore(true);
     try {
       const nextPage = pageRef.current + 1;
-      const data = await fetchPage(nextPage);
+      const data = await fetchPage(nextPage, cursorRef.current);
       const unique = data.filter((d) => !loadedIdsRef.current.has(d.id));
       unique.forEach((d) => loadedIdsRef.current.add(d.id));
       setImages((prev) => [...prev, ...unique]);
+      cursorRef.current = data.at(-1)?.next_cursor ?? cursorRef.current;
       setPage(nextPage);
-      setHasMore(data.length >= limit);
+      // trending stops handing out cursors at the server's depth cap
+      setHasMore(data.length >= limit && data.at(-1)?.next_cursor !== null);
     } catch (err: any) {
       setError(err?.message ?? "Failed to load more");
     } finally {
@@ -330,7 +344,7 @@ export function Gallery(): ReactElement {
           >
             <div className="relative aspect-square bg-gray-100">
               <img
-                src={img.image_url}
+                src={imageSrc(img.image_url)}
                 alt={img.image_name ?? img.original_filename}
                 className="h-full w-full object-cover"
                 loading="lazy"